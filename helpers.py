@@ -1,33 +1,255 @@
 import os
+import hashlib
 import json
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
 import requests
+from telegram.ext import BasePersistence
 
 
-class RequestHandler:
+class RateLimitExceeded(Exception):
+    """Raised instead of waiting when a key has used up its request budget."""
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per second, kept in STATE_DB so every worker shares a key's budget."""
+
+    def __init__(self, api_key: str, rate: float):
+        # buckets are named by a hash, keys are only stored in the credential store
+        self.bucket: str = hashlib.sha256(str(api_key).encode()).hexdigest()
+        self.rate: float = rate
+        self.path: str = os.getenv("STATE_DB", "state.db")
+        connection = self.connect()
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limits '
+                               '(bucket TEXT PRIMARY KEY, tokens REAL, updated_at REAL)')
+        finally:
+            connection.close()
+
+    def connect(self):
+        # autocommit, try_acquire manages its own transaction
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is available, never blocks the caller."""
+        connection = self.connect()
+        try:
+            # take the write lock up front so two workers can't spend the same token
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT tokens, updated_at FROM rate_limits WHERE bucket = ?',
+                                     (self.bucket,)).fetchone()
+            now = time.time()
+            tokens = self.rate if row is None else min(self.rate, row[0] + (now - row[1]) * self.rate)
+            acquired = tokens >= 1
+            if acquired:
+                tokens -= 1
+            connection.execute('REPLACE INTO rate_limits (bucket, tokens, updated_at) VALUES (?, ?, ?)',
+                               (self.bucket, tokens, now))
+            connection.execute('COMMIT')
+            return acquired
+        finally:
+            connection.close()
+
+
+class Client:
+    """Resources owned by a single API key: connection pool, rate limit bucket and portfolio cache."""
+
+    def __init__(self, api_key: str):
+        self.session = requests.Session()
+        self.rate_limiter = RateLimiter(api_key, float(os.getenv("RATE_LIMIT", 10)))
+        self.positions: list = None
+        self.positions_updated_at: float = 0
+
+    def close(self):
+        self.session.close()
+
+
+class ClientPool:
+    """Process-wide LRU of per-key clients, the least recently used client is evicted beyond MAX_CLIENTS."""
+    clients: OrderedDict = OrderedDict()
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls, api_key: str) -> Client:
+        with cls.lock:
+            if api_key in cls.clients:
+                cls.clients.move_to_end(api_key)
+                return cls.clients[api_key]
+
+            client = Client(api_key)
+            cls.clients[api_key] = client
+            while len(cls.clients) > int(os.getenv("MAX_CLIENTS", 100)):
+                _, evicted = cls.clients.popitem(last=False)
+                evicted.close()
+            return client
+
+    @classmethod
+    def evict(cls, api_key: str):
+        with cls.lock:
+            client = cls.clients.pop(api_key, None)
+        if client:
+            client.close()
+
+
+class CredentialStore:
+    """Per-user API keys, encrypted with CREDENTIALS_KEY and stored in a local SQLite database."""
+    instance = None
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        """Returns the shared store, or None if CREDENTIALS_KEY isn't set and personal keys are disabled."""
+        with cls.lock:
+            if cls.instance is None and os.getenv("CREDENTIALS_KEY"):
+                cls.instance = cls()
+            return cls.instance
+
+    def __init__(self):
+        # only needed once someone uses /login, keep it off the startup path
+        from cryptography.fernet import Fernet
+
+        self.path: str = os.getenv("CREDENTIALS_DB", "credentials.db")
+        self.fernet = Fernet(os.environ.get("CREDENTIALS_KEY"))
+        with self.connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS credentials (user_id INTEGER PRIMARY KEY, api_key BLOB)')
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def get_key(self, user_id: int):
+        with self.connect() as connection:
+            row = connection.execute('SELECT api_key FROM credentials WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        return self.fernet.decrypt(row[0]).decode()
+
+    def set_key(self, user_id: int, api_key: str):
+        token = self.fernet.encrypt(api_key.encode())
+        with self.connect() as connection:
+            connection.execute('REPLACE INTO credentials (user_id, api_key) VALUES (?, ?)', (user_id, token))
+
+    def delete_key(self, user_id: int):
+        api_key = self.get_key(user_id)
+        with self.connect() as connection:
+            connection.execute('DELETE FROM credentials WHERE user_id = ?', (user_id,))
+        return api_key
+
+
+class StatePersistence(BasePersistence):
+    """Conversation states and user/chat data in a local SQLite database shared by all workers."""
 
     def __init__(self):
-        self.api_key: str = os.environ.get("API_KEY")
+        super().__init__(store_user_data=True, store_chat_data=True, store_bot_data=False)
+        self.path: str = os.getenv("STATE_DB", "state.db")
+        with self.connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS data '
+                               '(kind TEXT, id INTEGER, data BLOB, PRIMARY KEY (kind, id))')
+            connection.execute('CREATE TABLE IF NOT EXISTS conversations '
+                               '(name TEXT, key TEXT, state BLOB, PRIMARY KEY (name, key))')
+
+    def connect(self):
+        # workers write concurrently, wait for the lock instead of failing
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, kind: str) -> defaultdict:
+        with self.connect() as connection:
+            rows = connection.execute('SELECT id, data FROM data WHERE kind = ?', (kind,)).fetchall()
+        return defaultdict(dict, {item_id: pickle.loads(data) for item_id, data in rows})
+
+    def load_one(self, kind: str, item_id: int) -> dict:
+        with self.connect() as connection:
+            row = connection.execute('SELECT data FROM data WHERE kind = ? AND id = ?', (kind, item_id)).fetchone()
+        return pickle.loads(row[0]) if row else {}
+
+    def save(self, kind: str, item_id: int, data: dict):
+        with self.connect() as connection:
+            connection.execute('REPLACE INTO data (kind, id, data) VALUES (?, ?, ?)',
+                               (kind, item_id, pickle.dumps(data)))
+
+    def get_user_data(self):
+        return self.load('user')
+
+    def get_chat_data(self):
+        return self.load('chat')
+
+    def get_bot_data(self):
+        # bot_data isn't used
+        return {}
+
+    def update_user_data(self, user_id: int, data: dict):
+        self.save('user', user_id, data)
+
+    def update_chat_data(self, chat_id: int, data: dict):
+        self.save('chat', chat_id, data)
+
+    def update_bot_data(self, data: dict):
+        pass
+
+    def refresh_user_data(self, user_id: int, user_data: dict):
+        # another worker may have owned this user before a restart
+        user_data.clear()
+        user_data.update(self.load_one('user', user_id))
+
+    def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        chat_data.clear()
+        chat_data.update(self.load_one('chat', chat_id))
+
+    def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    def get_conversations(self, name: str) -> dict:
+        with self.connect() as connection:
+            rows = connection.execute('SELECT key, state FROM conversations WHERE name = ?', (name,)).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    def update_conversation(self, name: str, key: tuple, new_state):
+        with self.connect() as connection:
+            if new_state is None:
+                connection.execute('DELETE FROM conversations WHERE name = ? AND key = ?', (name, json.dumps(key)))
+            else:
+                connection.execute('REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                                   (name, json.dumps(key), pickle.dumps(new_state)))
+
+
+class RequestHandler:
+
+    def __init__(self, api_key: str = None):
+        self.api_key: str = api_key or os.environ.get("API_KEY")
         self.url_trading: str = os.environ.get("BASE_URL_TRADING")
         self.url_market: str = os.environ.get("BASE_URL_DATA")
+        self.client: Client = ClientPool.get(self.api_key)
 
     def get_data_trading(self, endpoint: str):
-        response = requests.get(self.url_trading + endpoint, headers=self.headers)
+        self.check_rate_limit()
+        response = self.client.session.get(self.url_trading + endpoint, headers=self.headers)
         return response.json()
 
     def get_data_market(self, endpoint: str):
-        response = requests.get(self.url_market + endpoint, headers=self.headers)
+        self.check_rate_limit()
+        response = self.client.session.get(self.url_market + endpoint, headers=self.headers)
         return response.json()
 
     def post_data(self, endpoint: str, data):
-        response = requests.post(self.url_trading + endpoint,
-                                 json.dumps(data),
-                                 headers=self.headers)
+        self.check_rate_limit()
+        response = self.client.session.post(self.url_trading + endpoint,
+                                            json.dumps(data),
+                                            headers=self.headers)
         return response.json()
 
     def delete_data(self, endpoint: str):
-        response = requests.delete(self.url_trading + endpoint, headers=self.headers)
+        self.check_rate_limit()
+        response = self.client.session.delete(self.url_trading + endpoint, headers=self.headers)
         return response.json()
 
+    def check_rate_limit(self):
+        # handlers run on the dispatcher thread, waiting here would hold up every other user
+        if not self.client.rate_limiter.try_acquire():
+            raise RateLimitExceeded()
+
     @property
     def headers(self):
-        return {"Authorization": f"Bearer {self.api_key}"}
\ No newline at end of file
+        return {"Authorization": f"Bearer {self.api_key}"}
@@ -1,29 +1,34 @@
 import logging
+import multiprocessing
 import os
+import signal
+from queue import Empty
 from dotenv import load_dotenv
 
+from helpers import StatePersistence
+from models.ReferenceData import ReferenceData
 from models.TradingBot import TradingBot
 
+from telegram import Update
 from telegram.ext import (
+    CallbackContext,
     Updater,
     CommandHandler,
     MessageHandler,
     Filters,
     ConversationHandler,
+    TypeHandler,
 )
 
+# DEBUG would log raw updates, including API keys sent with /login
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    level=logging.DEBUG)
+                    level=logging.INFO)
 
 logger = logging.getLogger(__name__)
 
 
-def main() -> None:
-    load_dotenv()
-    """Start the bot."""
-    # Create the Updater and pass it to your bot's token.
-    updater = Updater(os.getenv('BOT_TOKEN'), use_context=True)
-
+def setup(updater: Updater, warmup_delay: float = 0) -> None:
+    """Registers the bot's handlers and warms up reference data, after `warmup_delay` seconds if given."""
     # Get the dispatcher to register handlers
     dispatcher = updater.dispatcher
 
@@ -43,7 +48,11 @@ def main() -> None:
             TradingBot.CONFIRMATION: [MessageHandler(Filters.text, TradingBot().complete_order)]
         },
         # if user currently in conversation but state has no handler or handle inappropriate for update
-        fallbacks=[CommandHandler(('cancel', 'end'), TradingBot().cancel)],
+        fallbacks=[CommandHandler(('cancel', 'end'), TradingBot().cancel),
+                   CommandHandler(('login', 'logout'), TradingBot().account_busy)],
+        # keep conversation state in the shared store so any worker can pick it up
+        name='trade',
+        persistent=True,
     )
 
     quick_conv_handler = ConversationHandler(
@@ -52,25 +61,134 @@ def main() -> None:
             TradingBot.QUICKTRADE: [MessageHandler(Filters.text & ~Filters.regex('^/'), TradingBot().perform_quicktrade)],
             TradingBot.QUICK: [MessageHandler(Filters.text & ~Filters.regex('^/'), TradingBot().confirm_quicktrade)],
         },
-        fallbacks=[CommandHandler('cancel', TradingBot().cancel)]
+        fallbacks=[CommandHandler('cancel', TradingBot().cancel),
+                   CommandHandler(('login', 'logout'), TradingBot().account_busy)],
+        name='quicktrade',
+        persistent=True,
     )
 
     positions_handler = CommandHandler('positions', TradingBot().show_positions)
     start_handler = CommandHandler('start', TradingBot().start)
     moon_handler = CommandHandler('moon', TradingBot().to_the_moon)
+    # never accept API keys in group chats
+    login_handler = CommandHandler('login', TradingBot().login, filters=Filters.chat_type.private)
+    logout_handler = CommandHandler('logout', TradingBot().logout, filters=Filters.chat_type.private)
     dispatcher.add_handler(start_handler)
     dispatcher.add_handler(conv_handler)
     dispatcher.add_handler(moon_handler)
     dispatcher.add_handler(positions_handler)
     dispatcher.add_handler(quick_conv_handler)
+    dispatcher.add_handler(login_handler)
+    dispatcher.add_handler(logout_handler)
+
+    refresh_interval = int(os.getenv('REFRESH_INTERVAL', 3600))
+    if warmup_delay:
+        # the first run fills the cache, handlers fall back to live requests until then
+        updater.job_queue.run_repeating(ReferenceData.refresh, interval=refresh_interval, first=warmup_delay)
+        return
+
+    # warm up reference data before polling and keep it current in the background
+    ReferenceData.load()
+    if not ReferenceData.is_ready():
+        logger.warning('Reference data incomplete, falling back to live requests until next refresh.')
+    updater.job_queue.run_repeating(ReferenceData.refresh, interval=refresh_interval, first=refresh_interval)
+
+
+def get_shard(update: Update, workers: int) -> int:
+    """Returns the worker that owns the update's chat."""
+    if update.effective_chat:
+        return update.effective_chat.id % workers
+    if update.effective_user:
+        return update.effective_user.id % workers
+    return 0
+
+
+def run_worker(shard: int, queue: multiprocessing.Queue) -> None:
+    """Processes the updates routed to one shard of chats."""
+    # Ctrl-C and platform restarts signal every process, leave shutdown to the ingestion process so the queue
+    # is drained up to its sentinel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    load_dotenv()
+    updater = Updater(os.getenv('BOT_TOKEN'), use_context=True, persistence=StatePersistence())
+    # every worker keeps its own reference data, stagger the loads so they don't all hit the API at once
+    setup(updater, warmup_delay=shard * float(os.getenv('WARMUP_STAGGER', 5)))
+    updater.job_queue.start()
+    logger.info(f'Worker {shard} ready.')
+
+    while True:
+        data = queue.get()
+        # None is sent by the ingestion process on shutdown
+        if data is None:
+            break
+        updater.dispatcher.process_update(Update.de_json(data, updater.bot))
+
+    # the dispatcher's thread pool isn't daemonic, stop it or the process never exits
+    updater.job_queue.stop()
+    updater.dispatcher.stop()
 
 
-    # Start the Bot
+def main() -> None:
+    load_dotenv()
+    """Start the bot."""
+    workers = int(os.getenv('WORKERS', 1))
+
+    if workers == 1:
+        # Create the Updater and pass it to your bot's token.
+        updater = Updater(os.getenv('BOT_TOKEN'), use_context=True, persistence=StatePersistence())
+        setup(updater)
+
+        # Start the Bot
+        updater.start_polling()
+
+        # Run the Bot until you press Ctrl-C
+        updater.idle()
+        return
+
+    # spawn rather than fork, workers are restarted while this process is running threads
+    mp_context = multiprocessing.get_context('spawn')
+    queues = [mp_context.Queue() for _ in range(workers)]
+
+    def start_worker(shard: int) -> multiprocessing.Process:
+        process = mp_context.Process(target=run_worker, args=(shard, queues[shard]))
+        process.start()
+        return process
+
+    processes = [start_worker(shard) for shard in range(workers)]
+
+    def watch_workers(context: CallbackContext) -> None:
+        """Restarts dead workers, their queued updates are handed to the new process where possible."""
+        for shard, process in enumerate(processes):
+            if not process.is_alive():
+                logger.error(f'Worker {shard} exited with code {process.exitcode}, restarting it.')
+                # a worker killed while waiting on its queue keeps the read lock, move the backlog to a fresh queue
+                old_queue, queues[shard] = queues[shard], mp_context.Queue()
+                try:
+                    while True:
+                        queues[shard].put(old_queue.get(timeout=1))
+                except Empty:
+                    pass
+                if old_queue.qsize():
+                    logger.error(f'{old_queue.qsize()} updates for worker {shard} could not be recovered.')
+                processes[shard] = start_worker(shard)
+
+    # this process only polls Telegram and routes every update to the worker owning its chat
+    updater = Updater(os.getenv('BOT_TOKEN'), use_context=True)
+    updater.dispatcher.add_handler(
+        TypeHandler(Update, lambda update, context: queues[get_shard(update, workers)].put(update.to_dict()))
+    )
+    updater.job_queue.run_repeating(watch_workers, interval=5)
     updater.start_polling()
 
-    # Run the Bot until you press Ctrl-C
+    # stops polling and the watchdog on SIGINT/SIGTERM, the workers then drain their queues
     updater.idle()
 
+    for queue in queues:
+        queue.put(None)
+    for process in processes:
+        process.join()
+
 
 if __name__ == '__main__':
     main()
@@ -3,6 +3,12 @@ from helpers import RequestHandler
 
 class Account(RequestHandler):
 
+    def get_account(self):
+        endpoint = 'account/'
+
+        response = self.get_data_trading(endpoint)
+        return response['results']
+
     def get_balance(self):
         endpoint = 'account/'
 
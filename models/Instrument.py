@@ -5,6 +5,9 @@ from helpers import RequestHandler
 
 
 class Instrument(RequestHandler):
+    # GME, BB, CLOV, AMC, PLTR, WISH, NIO, TSLA, Tilray, NOK
+    MEMES = ['US36467W1099', 'CA09228F1036', 'US18914F1030', 'US00165C1045', 'US69608A1088', 'US21077C1071',
+             'US62914V1061', 'US88160R1014', 'US88688T1007', 'FI0009000681']
 
     def get_names(self, search_query: str, instrument_type: str):
         mic = os.getenv("MIC")
@@ -45,10 +48,10 @@ class Instrument(RequestHandler):
         endpoint = f'instruments/?search={search_query}&type={instrument_type}'
         return self.get_data_market(endpoint)['results'][0]
 
-    def get_memes(self):
-        # GME, BB, CLOV, AMC, PLTR, WISH, NIO, TSLA, Tilray, NOK
-        memes = ['US36467W1099', 'CA09228F1036', 'US18914F1030', 'US00165C1045', 'US69608A1088', 'US21077C1071',
-                 'US62914V1061', 'US88160R1014', 'US88688T1007', 'FI0009000681']
-        endpoint = f'instruments/?type=stock&isin={random.choice(memes)}'
+    def get_meme_title(self, isin: str):
+        endpoint = f'instruments/?type=stock&isin={isin}'
         response = self.get_data_market(endpoint)
         return response['results'][0]['title']
+
+    def get_memes(self):
+        return self.get_meme_title(random.choice(self.MEMES))
@@ -20,6 +20,8 @@ class Order(RequestHandler):
     def activate_order(self, order_id: str):
         endpoint = f'orders/{order_id}/activate/'
         response = self.post_data(endpoint, {})
+        # positions change once the order executes
+        self.client.positions = None
         return response
 
     def get_order(self, order_id: str):
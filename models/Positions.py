@@ -1,10 +1,20 @@
+import os
+import time
+
 from helpers import RequestHandler
 
 
 class Positions(RequestHandler):
 
     def get_positions(self):
+        # serve the key's cached portfolio while it is fresh
+        if self.client.positions is not None and \
+                time.monotonic() - self.client.positions_updated_at < float(os.getenv("POSITIONS_TTL", 30)):
+            return self.client.positions
+
         endpoint = 'positions/'
         response = self.get_data_trading(endpoint)
+        self.client.positions = response['results']
+        self.client.positions_updated_at = time.monotonic()
         return response['results']
 
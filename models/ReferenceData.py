@@ -0,0 +1,53 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models.Instrument import Instrument
+
+
+class ReferenceData:
+    """Process-wide cache of the meme stock titles."""
+    meme_titles: dict = {}
+
+    ready = threading.Event()
+
+    @classmethod
+    def load(cls) -> bool:
+        """Fetches all meme titles concurrently, returns True if everything was loaded."""
+        tasks = {isin: (Instrument().get_meme_title, isin) for isin in Instrument.MEMES}
+
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = {key: executor.submit(*task) for key, task in tasks.items()}
+
+        complete = True
+        for key, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f'could not load {key}: {e}')
+                complete = False
+                continue
+
+            cls.meme_titles[key] = result
+
+        # ready once everything has been loaded, failed refreshes keep serving the previous data
+        if complete and not cls.ready.is_set():
+            cls.ready.set()
+            print('Reference data ready.')
+        return complete
+
+    @classmethod
+    def refresh(cls, context=None) -> None:
+        """Job queue callback that reloads the cache in the background."""
+        cls.load()
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        """True once every item has been loaded, until then handlers fall back to live requests."""
+        return cls.ready.is_set()
+
+    @classmethod
+    def get_meme(cls) -> str:
+        if cls.is_ready():
+            return random.choice(list(cls.meme_titles.values()))
+        return Instrument().get_memes()
@@ -5,10 +5,12 @@ import dotenv
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import CallbackContext, ConversationHandler
 
+from helpers import ClientPool, CredentialStore, RateLimitExceeded
 from models.Instrument import Instrument
 from models.Order import Order
 from models.Positions import Positions
 from models.Account import Account
+from models.ReferenceData import ReferenceData
 from models.TradingVenue import TradingVenue
 
 
@@ -18,6 +20,88 @@ class TradingBot:
     dotenv_file = dotenv.find_dotenv()
     dotenv.load_dotenv(dotenv_file)
 
+    @staticmethod
+    def get_api_key(update: Update):
+        """Returns the user's stored API key, None falls back to the deployment's API_KEY."""
+        store = CredentialStore.get()
+        if store is None:
+            return None
+        return store.get_key(update.effective_user.id)
+
+    def login(self, update: Update, context: CallbackContext):
+        """Stores the user's lemon.markets API key."""
+        store = CredentialStore.get()
+        if store is None:
+            update.message.reply_text(
+                'Personal API keys are not enabled for this bot.'
+            )
+            return
+
+        # don't leave the key lying around in the chat history
+        try:
+            update.message.delete()
+        except Exception as e:
+            print(e)
+
+        # the message is gone, so send new messages instead of replying to it
+        if len(context.args) != 1:
+            update.effective_chat.send_message(
+                'Please send your API key in the following format: \'/login <api key>\''
+            )
+            return
+
+        try:
+            Account(context.args[0]).get_account()
+        except RateLimitExceeded:
+            update.effective_chat.send_message('Too many requests, please try again shortly.')
+            return
+        except Exception as e:
+            print(e)
+            ClientPool.evict(context.args[0])
+            update.effective_chat.send_message(
+                'This API key was not accepted by lemon.markets, please check it and try again.'
+            )
+            return
+
+        store.set_key(update.effective_user.id, context.args[0])
+        update.effective_chat.send_message(
+            'Your API key has been saved. All of your trades will now be placed on your own account.'
+        )
+
+    def logout(self, update: Update, context: CallbackContext):
+        """Removes the user's API key and releases their resources."""
+        store = CredentialStore.get()
+        if store is None:
+            update.message.reply_text(
+                'Personal API keys are not enabled for this bot.'
+            )
+            return
+
+        api_key = store.delete_key(update.effective_user.id)
+        if api_key is None:
+            update.message.reply_text(
+                'You haven\'t saved an API key, your trades are placed on the bot\'s default account.'
+            )
+            return
+
+        ClientPool.evict(api_key)
+        update.message.reply_text(
+            'Your API key has been removed.'
+        )
+
+    def account_busy(self, update: Update, context: CallbackContext):
+        """Refuses /login and /logout during a trade, so orders are activated on the account that placed them."""
+        try:
+            update.message.delete()
+        except Exception as e:
+            print(e)
+
+        update.effective_chat.send_message(
+            'Please finish or /cancel your current trade before changing your API key.'
+        )
+        # stay in the current conversation state
+        return None
+
     def start(self, update: Update, context: CallbackContext) -> int:
         """Initiates conversation."""
         context.chat_data.clear()
@@ -27,15 +111,20 @@ class TradingBot:
         user = update.message.from_user.name
 
         # if Trading Venue closed, indicate next opening time and end conversation
-        if not TradingVenue().is_open():
-            opening_date: str = TradingVenue().get_next_opening_day()
-            opening_time: str = TradingVenue().get_next_opening_time()
+        try:
+            venue = TradingVenue(self.get_api_key(update)).get_venue()
+        except RateLimitExceeded:
+            update.message.reply_text('Too many requests, please try again shortly.')
+            return ConversationHandler.END
+        if not venue['is_open']:
+            opening_date: str = venue['opening_days'][0]
+            opening_time: str = venue['opening_hours']['start']
             update.message.reply_text(
                 f'This exchange is closed at the moment. Please try again on {opening_date} at {opening_time}.'
             )
             return ConversationHandler.END
 
-        update.message.reply_text(
+        commands = (
             f'Hi {user}! I\'m the Lemon Trader Bot! I can place trades for you using the lemon.markets API. '
             'You can control me by sending or clicking on these commands:\n\n'
 
@@ -46,6 +135,16 @@ class TradingBot:
             '/moon - meme stock generator\n'
         )
 
+        # personal keys are only accepted in private chats and when the credential store is enabled
+        if CredentialStore.get() is not None and update.effective_chat.type == 'private':
+            commands += (
+                '\nAccount Commands:\n'
+                '/login <api key> - trade on your own account\n'
+                '/logout - remove your API key\n'
+            )
+
+        update.message.reply_text(commands)
+
         print("Conversation started.")
         print(context.chat_data)
 
@@ -77,13 +176,14 @@ class TradingBot:
                 else:
                     instrument_type = trade_elements[3].lower()
 
-                instrument = Instrument().get_quick_isin(search, instrument_type)
+                api_key = self.get_api_key(update)
+                instrument = Instrument(api_key).get_quick_isin(search, instrument_type)
 
-                context.chat_data['order'] = Order().place_order(instrument['isin'],
-                                                                 "p0d",
-                                                                 quantity,
-                                                                 side)
-                [context.chat_data['bid'], context.chat_data['ask']] = Instrument().get_price(instrument['isin'])
+                context.chat_data['order'] = Order(api_key).place_order(instrument['isin'],
+                                                                        "p0d",
+                                                                        quantity,
+                                                                        side)
+                [context.chat_data['bid'], context.chat_data['ask']] = Instrument(api_key).get_price(instrument['isin'])
                 reply_keyboard = [['Confirm', 'Cancel']]
 
                 if side == 'buy':
@@ -101,6 +201,9 @@ class TradingBot:
                 )
                 return TradingBot.QUICK
 
+            except RateLimitExceeded:
+                update.message.reply_text('Too many requests, please try again shortly.')
+                return None
             except Exception as e:
                 print(e)
                 update.message.reply_text(
@@ -118,16 +221,22 @@ class TradingBot:
                 return ConversationHandler.END
             try:
                 print(context.chat_data)
-                order = Order().activate_order(context.chat_data['order']['results'].get('id'))
+                api_key = self.get_api_key(update)
+                order = Order(api_key).activate_order(context.chat_data['order']['results'].get('id'))
                 update.message.reply_text(
                     "Please wait while we process your order."
                 )
                 start = datetime.datetime.now()
                 while True and len(context.chat_data['order']) > 1:
 
-                    order_summary = Order().get_order(
-                        context.chat_data['order']['results'].get('id')
-                    )
+                    try:
+                        order_summary = Order(api_key).get_order(
+                            context.chat_data['order']['results'].get('id')
+                        )
+                    except RateLimitExceeded:
+                        # the order is already active, poll again once the budget allows
+                        time.sleep(2)
+                        continue
                     if order_summary['results'].get('status') == 'executed':
                         context.chat_data['average_price'] = order_summary['results'].get('executed_price')
                         print('executed')
@@ -138,7 +247,7 @@ class TradingBot:
                             'later. '
                         )
                         # delete inactive order
-                        Order().delete_order(context.chat_data['order']['results'].get('id'))
+                        Order(api_key).delete_order(context.chat_data['order']['results'].get('id'))
                         return ConversationHandler.END
                     time.sleep(2)
 
@@ -147,6 +256,9 @@ class TradingBot:
                 )
                 return ConversationHandler.END
 
+            except RateLimitExceeded:
+                update.message.reply_text('Too many requests, please try again shortly.')
+                return None
             except Exception as e:
                 print(e)
                 update.message.reply_text(
@@ -198,8 +310,11 @@ class TradingBot:
         print(f'chat_data {context.chat_data}')
 
         try:
-            instruments = Instrument().get_names(context.chat_data['search_query'],
-                                                  context.chat_data['type'])
+            instruments = Instrument(self.get_api_key(update)).get_names(context.chat_data['search_query'],
+                                                                          context.chat_data['type'])
+        except RateLimitExceeded:
+            update.message.reply_text('Too many requests, please try again shortly.')
+            return None
         except Exception as e:
             print(e)
             update.message.reply_text(
@@ -224,8 +339,11 @@ class TradingBot:
         text = update.message.text
 
         try:
-            instruments = Instrument().get_names(context.chat_data['search_query'],
-                                                  context.chat_data['type'])
+            instruments = Instrument(self.get_api_key(update)).get_names(context.chat_data['search_query'],
+                                                                          context.chat_data['type'])
+        except RateLimitExceeded:
+            update.message.reply_text('Too many requests, please try again shortly.')
+            return None
         except Exception as e:
             print(e)
             update.message.reply_text(
@@ -257,8 +375,12 @@ class TradingBot:
         indicate quantity. """
         context.chat_data['side'] = update.message.text.lower()
         try:
-            [context.chat_data['bid'], context.chat_data['ask']] = Instrument().get_price(context.chat_data['isin'])
-            context.chat_data['balance'] = Account().get_balance()
+            api_key = self.get_api_key(update)
+            [context.chat_data['bid'], context.chat_data['ask']] = Instrument(api_key).get_price(context.chat_data['isin'])
+            context.chat_data['balance'] = Account(api_key).get_balance()
+        except RateLimitExceeded:
+            update.message.reply_text('Too many requests, please try again shortly.')
+            return None
         except Exception as e:
             print(e)
             update.message.reply_text(
@@ -274,7 +396,11 @@ class TradingBot:
             )
         # if user chooses sell, retrieve how many shares owned
         else:
-            positions = Positions().get_positions()
+            try:
+                positions = Positions(api_key).get_positions()
+            except RateLimitExceeded:
+                update.message.reply_text('Too many requests, please try again shortly.')
+                return None
             print(positions)
             # initialise shares owned to 0
             context.chat_data['shares_owned'] = 0
@@ -342,12 +468,15 @@ class TradingBot:
             try:
                 # place order
                 context.chat_data['order_id'] = \
-                    Order().place_order(
+                    Order(self.get_api_key(update)).place_order(
                         isin=context.chat_data['isin'],
                         expires_at="p0d",
                         side=context.chat_data['side'],
                         quantity=context.chat_data['quantity']
                     ).get('results')['id']
+            except RateLimitExceeded:
+                update.message.reply_text('Too many requests, please try again shortly.')
+                return None
             except Exception as e:
                 print(e)
                 update.message.reply_text(
@@ -381,9 +510,13 @@ class TradingBot:
             )
         else:
             try:
-                Order().activate_order(
+                api_key = self.get_api_key(update)
+                Order(api_key).activate_order(
                     context.chat_data['order_id'],
                 )
+            except RateLimitExceeded:
+                update.message.reply_text('Too many requests, please try again shortly.')
+                return None
             except Exception as e:
                 print(e)
                 update.message.reply_text(
@@ -395,9 +528,13 @@ class TradingBot:
                 'Please wait while we process your order.'
             )
             while True:
-                order_summary = Order().get_order(
-                    context.chat_data['order_id'],
-                )
+                try:
+                    order_summary = Order(api_key).get_order(
+                        context.chat_data['order_id'],
+                    )
+                except RateLimitExceeded:
+                    time.sleep(2)
+                    continue
                 if order_summary['results'].get('status') == 'executed':
                     print('executed')
                     break
@@ -445,7 +582,10 @@ class TradingBot:
     def to_the_moon(self, update: Update, context: CallbackContext):
         """Randomly prints a meme stock."""
         try:
-            meme_stock = Instrument().get_memes()
+            meme_stock = ReferenceData.get_meme()
+        except RateLimitExceeded:
+            update.message.reply_text('Too many requests, please try again shortly.')
+            return None
         except Exception as e:
             print(e)
             update.message.reply_text(
@@ -458,8 +598,11 @@ class TradingBot:
 
     def show_positions(self, update: Update, context: CallbackContext):
         try:
-            positions = Positions().get_positions()
+            positions = Positions(self.get_api_key(update)).get_positions()
             print(positions)
+        except RateLimitExceeded:
+            update.message.reply_text('Too many requests, please try again shortly.')
+            return None
         except Exception as e:
             print(e)
             update.message.reply_text(
@@ -6,20 +6,17 @@ from helpers import RequestHandler
 
 class TradingVenue(RequestHandler):
 
-    def is_open(self) -> bool:
+    def get_venue(self) -> dict:
         mic: str = os.environ.get("MIC")
         endpoint = f'venues/?mic={mic}'
         response = self.get_data_market(endpoint)
-        return response['results'][0]['is_open']
+        return response['results'][0]
+
+    def is_open(self) -> bool:
+        return self.get_venue()['is_open']
 
     def get_next_opening_time(self):
-        mic: str = os.environ.get("MIC")
-        endpoint = f'venues/?mic={mic}'
-        response = self.get_data_market(endpoint)
-        return response['results'][0]['opening_hours']['start']
+        return self.get_venue()['opening_hours']['start']
 
     def get_next_opening_day(self):
-        mic: str = os.environ.get("MIC")
-        endpoint = f'venues/?mic={mic}'
-        response = self.get_data_market(endpoint)
-        return response['results'][0]['opening_days'][0]
+        return self.get_venue()['opening_days'][0]